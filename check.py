@@ -5,48 +5,20 @@ import os
 import sys
 import logging
 import argparse
-import json
 
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from syno.api import Syno
+import common
+import evict
+import nodes
+import rules
+import series
+import tasks
 
 __description__ = 'Synology Download Station Task Manager'
 __epilog__ = 'Report bugs to <yehcj.tw@gmail.com>'
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-file_handler = logging.FileHandler(os.path.join(
-    os.path.dirname(os.path.abspath(__file__)),
-    'check.log'
-))
-file_handler.setLevel(logging.DEBUG)
-file_handler.setFormatter(formatter)
-
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.DEBUG)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
-
-def load(file: str) -> dict:
-    '''Load configuration from JSON file'''
-    logger.debug('file=%s', file)
-
-    if not os.path.exists(file):
-        return None
-
-    config = {}
-    with open(file, 'r') as fp:
-        config = json.load(fp)
-
-    return config
+logger = logging.getLogger(__name__)
 
 def clean(path: str, tid: str) -> None:
     '''Clean up local torrent information files'''
@@ -60,50 +32,8 @@ def clean(path: str, tid: str) -> None:
     if os.path.exists(loaded):
         os.remove(loaded)
 
-def free(task: str, path: str, tid: str) -> bool:
-    '''Check if a task is free'''
-    logger.debug('task=%s, path=%s, tid=%s', task, path, tid)
-
-    file = os.path.join(path, f'{tid}.info')
-    if not os.path.exists(file):
-        logger.debug('action=pass, reason=!info')
-        return True
-
-    info = None
-    with open(file, 'r') as fp:
-        info = json.load(fp)
-
-    if info is None:
-        logger.debug('action=delete, reason=!info')
-        return False
-
-    if info['status']['discountEndTime'] is None:
-        logger.debug('action=delete, reason=!endtime')
-        return False
-
-    end = datetime.strptime(
-        info['status']['discountEndTime'],
-        '%Y-%m-%d %H:%M:%S'
-    )
-    now = datetime.now()
-
-    if end - now < timedelta(minutes=5):
-        logger.debug(
-            'end=%s, action=delete, reason=!free',
-            info['status']['discountEndTime']
-        )
-        clean(path=path, tid=tid)
-        return False
-    else:
-        logger.debug('action=pass, reason=free')
-
-    return True
-
-def main():
-    parser = argparse.ArgumentParser(
-        description=__description__,
-        epilog=__epilog__
-    )
+def arguments(parser: argparse.ArgumentParser) -> None:
+    '''Register the command line arguments'''
     parser.add_argument(
         '--ip',
         type=str,
@@ -144,105 +74,139 @@ def main():
         action='store_true',
         help='Verbose mode'
     )
-    args = parser.parse_args(sys.argv[1:])
-
-    # load configuration file
-    config = load(os.path.join(
-        os.path.dirname(os.path.realpath(__file__)),
-        'synology.json'
-    ))
 
+def run(args, snapshot: tasks.Snapshot = None) -> None:
+    '''Check the tasks and delete or resume them'''
     # overwrite the configuration if a parameter is provided
-    for key, value in vars(args).items():
-        if value is None and key in config:
-            setattr(args, key, config[key])
+    config = common.load('synology.json')
+    common.merge(args, config)
+
+    # lifecycle rules, falling back to the built-in ones
+    compiled = rules.build((config or {}).get('rules'))
 
     delete_tasks = []
     resume_tasks = []
 
-    # Current time
-    now_dt = datetime.now()
-    now_ts = now_dt.timestamp()
-
-    with Syno(
+    targets = nodes.targets(
+        config,
         ip=args.ip,
         port=args.port,
         account=args.account,
-        password=args.password
-    ) as syno:
-        logger.debug('action=login')
-
-        items = syno.ds.task.list()
-        logger.debug('action=list, count=%d', len(items))
-
-        for item in items:
-            tid = item['additional']['detail']['uri'].replace('.torrent', '')
-            task = item['id']
-            status = item['status']
-            title = item['title']
-            detail = item['additional']['detail']
-            transfer = item['additional']['transfer']
-
-            logger.debug('tid=%s, task=%s, status=%s', tid, task, status)
-
-            if status == 'downloading':
-                # Check for stuck downloads
-                started_time = detail['started_time']
-                if started_time <= 0:
-                     started_time = detail['create_time']
-
-                if transfer['downloaded_pieces'] == 0 and (now_ts - started_time) > 3600:
-                    logger.debug(
-                        'action=delete, reason=stuck, duration=%ds',
-                        now_ts - started_time
-                    )
-                    delete_tasks.append({'id': task, 'tid': tid, 'title': title})
-
-                if not free(task=task, path=args.path, tid=tid):
-                    delete_tasks.append({'id': task, 'tid': tid, 'title': title})
-
-            if status == 'waiting':
-                # completed, but reverted to waiting due to error
-                if detail['completed_time'] > 0:
-                    logger.debug('action=pass, reason=completed')
-                    continue
-
-                if not free(task=task, path=args.path, tid=tid):
-                    delete_tasks.append({'id': task, 'tid': tid, 'title': title})
-
-            if status == 'error':
-                resume_tasks.append({'id': task, 'tid': tid, 'title': title})
-
-            if status == 'seeding':
-                # Check for seeding over 7 days
-                completed_time = detail['completed_time']
-                if completed_time > 0 and (now_ts - completed_time) > (7 * 86400):
-                    logger.debug(
-                        'action=delete, reason=seeding_over_7_days, duration=%ds',
-                        now_ts - completed_time
-                    )
-                    delete_tasks.append({'id': task, 'tid': tid, 'title': title})
-
-        if args.verbose:
-            if len(delete_tasks) > 0:
-                logger.info('Tasks to delete:')
-                for t in delete_tasks:
-                    logger.info('  %s: %s', t['id'], t['title'])
-
-            if len(resume_tasks) > 0:
-                logger.info('Tasks to resume:')
-                for t in resume_tasks:
-                    logger.info('  %s: %s', t['id'], t['title'])
-
-        if not args.dry_run:
-            if len(delete_tasks) > 0:
-                syno.ds.task.delete(tasks=[t['id'] for t in delete_tasks])
+        password=args.password,
+        path=args.path
+    )
+    paths = {node['name']: node['path'] for node in targets}
+    if snapshot is None:
+        snapshot = nodes.poll(targets)
+
+    now = datetime.now().timestamp()
+    table = rules.Table(snapshot, paths=paths, now=now, rules=compiled)
+
+    # record the transfer samples and derive the history columns
+    store = (config or {}).get('series', {})
+    evictions = evict.blocks(config, targets)
+    history = series.update(
+        table,
+        now=now,
+        config=store,
+        window=max(
+            [store.get('window', 86400)] +
+            [e.get('window', 86400) for e in evictions.values()]
+        )
+    )
+    table.attach(
+        history,
+        now=now,
+        count=store.get('samples', 6),
+        window=store.get('window', 86400)
+    )
+
+    picked = rules.evaluate(compiled, table)
+
+    # evict the least efficient seeding tasks of every node whose disk is full
+    for name, block in evictions.items():
+        picked.update(evict.evaluate(
+            block,
+            table,
+            picked,
+            history=history,
+            now=now,
+            node=name
+        ))
+
+    reasons = {}
+    for index, (action, why) in sorted(picked.items()):
+        task = table.tasks[index]
+        reasons[task] = '; '.join(why)
+        logger.debug('%s', common.KV(
+            action=action,
+            node=task.node,
+            tid=task.tid,
+            task=task.id,
+            reason=reasons[task]
+        ))
+
+        if action == 'delete':
+            delete_tasks.append(task)
+        else:
+            resume_tasks.append(task)
+
+    if args.verbose:
+        if len(delete_tasks) > 0:
+            logger.info('Tasks to delete:')
+            for t in delete_tasks:
+                logger.info(
+                    '  %s/%s: %s (%s)',
+                    t.node,
+                    t.id,
+                    t.title,
+                    reasons[t]
+                )
+
+        if len(resume_tasks) > 0:
+            logger.info('Tasks to resume:')
+            for t in resume_tasks:
+                logger.info(
+                    '  %s/%s: %s (%s)',
+                    t.node,
+                    t.id,
+                    t.title,
+                    reasons[t]
+                )
+
+    if not args.dry_run:
+        for node, picked in nodes.group(targets, delete_tasks):
+            if len(picked) > 0:
+                nodes.session(node).ds.task.delete(
+                    tasks=[t.id for t in picked]
+                )
                 # Clean up local files for deleted tasks
-                for t in delete_tasks:
-                    clean(path=args.path, tid=t['tid'])
+                for t in picked:
+                    clean(path=node['path'], tid=t.tid)
+
+        for node, picked in nodes.group(targets, resume_tasks):
+            if len(picked) > 0:
+                nodes.session(node).ds.task.resume(
+                    tasks=[t.id for t in picked]
+                )
+
+    # Deleted tasks are no longer active for the following steps
+    snapshot.discard({t.tid for t in delete_tasks})
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__description__,
+        epilog=__epilog__
+    )
+    arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    common.setup_logging(file='check.log', level=logging.DEBUG)
 
-            if len(resume_tasks) > 0:
-                syno.ds.task.resume(tasks=[t['id'] for t in resume_tasks])
+    try:
+        run(args)
+    finally:
+        common.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -9,56 +9,27 @@ import argparse
 import glob
 import logging
 
-from syno.api import Syno
+import common
+import nodes
+import tasks
 
 __description__ = 'Clean up orphaned torrent metadata files'
 __epilog__ = 'Report bugs to <yehcj.tw@gmail.com>'
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-# Set up stream handler for console output
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)
-stream_handler.setFormatter(formatter)
-logger.addHandler(stream_handler)
-
-def load(file: str) -> dict:
-    '''Load configuration from a JSON file'''
-    if not os.path.exists(file):
-        return None
-
-    with open(file, 'r') as fp:
-        return json.load(fp)
-
-def get_active_tids(ip: str, port: str, account: str, password: str) -> set:
-    '''Retrieve active task IDs from Synology NAS'''
-    active_tids = set()
+def get_active_tids(targets: list) -> tasks.Snapshot:
+    '''Retrieve active tasks from every Synology NAS'''
     try:
-        with Syno(
-            ip=ip,
-            port=port,
-            account=account,
-            password=password
-        ) as syno:
-            items = syno.ds.task.list()
-            for item in items:
-                # Extract TID from the torrent URI
-                uri = item.get('additional', {}).get('detail', {}).get('uri', '')
-                tid = uri.replace('.torrent', '')
-                if tid:
-                    active_tids.add(tid)
-            logger.info('Retrieved %d active tasks from Synology', len(active_tids))
+        snapshot = nodes.poll(targets)
+        logger.info('Retrieved %d active tasks from Synology', len(snapshot.tids))
+        return snapshot
 
     except Exception as e:
         logger.error('Failed to connect to Synology: %s', e)
         logger.warning('Continuing without Synology task list')
 
-    return active_tids
+    return None
 
 def process_loaded_files(args):
     '''Update list.json with .loaded files and remove them'''
@@ -130,12 +101,8 @@ def clean_orphaned_info(args, active_tids):
 
     return orphaned_count
 
-def main():
-    '''Entry point: parse arguments and execute cleanup'''
-    parser = argparse.ArgumentParser(
-        description=__description__,
-        epilog=__epilog__
-    )
+def arguments(parser: argparse.ArgumentParser) -> None:
+    '''Register the command line arguments'''
     parser.add_argument(
         '--output',
         type=str,
@@ -178,50 +145,74 @@ def main():
         default=None,
         help='Synology NAS user password'
     )
-    args = parser.parse_args(sys.argv[1:])
-
-    # Apply log level
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logger.setLevel(log_level)
-    stream_handler.setLevel(log_level)
-
-    # Load configuration files
-    base = os.path.dirname(os.path.realpath(__file__))
-    mt_config = load(os.path.join(base, 'mt.json'))
-    syno_config = load(os.path.join(base, 'synology.json'))
 
+def run(args, snapshot: tasks.Snapshot = None) -> None:
+    '''Update the history and remove orphaned metadata files'''
     # Merge configurations
-    if args.output is None and mt_config:
-        args.output = mt_config.get('output')
+    common.merge(
+        args,
+        {'output': (common.load('mt.json') or {}).get('output')},
+        common.load('synology.json'),
+        {'port': '5000'}
+    )
 
-    if syno_config:
-        if args.ip is None:
-            args.ip = syno_config.get('ip')
-        if args.port is None:
-            args.port = syno_config.get('port', '5000')
-        if args.account is None:
-            args.account = syno_config.get('account')
-        if args.password is None:
-            args.password = syno_config.get('password')
+    targets = nodes.targets(
+        common.load('synology.json'),
+        ip=args.ip,
+        port=args.port,
+        account=args.account,
+        password=args.password,
+        watch=args.output
+    )
 
-    logger.info('Starting cleanup in %s', args.output)
+    # Nodes sharing a watch directory are cleaned up together
+    outputs = {}
+    for node in targets:
+        outputs.setdefault(node['watch'], set()).add(node['name'])
 
     # Step 1: Process .loaded files and update history
-    process_loaded_files(args)
+    for output in outputs:
+        logger.info('Starting cleanup in %s', output)
+        process_loaded_files(argparse.Namespace(**{**vars(args), 'output': output}))
 
     # Step 2: Get active tasks from Synology
-    active_tids = get_active_tids(
-        ip=args.ip,
-        port=args.port,
-        account=args.account,
-        password=args.password
-    )
+    if snapshot is None:
+        snapshot = get_active_tids(targets)
 
     # Step 3: Clean up orphaned .info files
-    if active_tids:
-        clean_orphaned_info(args, active_tids)
-    else:
+    if snapshot is None or not snapshot.tids:
         logger.warning('Skipping orphaned .info cleanup as no active tasks were found')
+        return
+
+    for output, names in outputs.items():
+        if names & snapshot.failed:
+            logger.warning('Skipping orphaned .info cleanup in %s', output)
+            continue
+
+        clean_orphaned_info(
+            argparse.Namespace(**{**vars(args), 'output': output}),
+            snapshot.tids
+        )
+
+def main():
+    '''Entry point: parse arguments and execute cleanup'''
+    parser = argparse.ArgumentParser(
+        description=__description__,
+        epilog=__epilog__
+    )
+    arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    # Apply log level
+    common.setup_logging(
+        level=logging.DEBUG if args.verbose else logging.INFO
+    )
+
+    try:
+        run(args)
+    finally:
+        common.close()
 
 if __name__ == '__main__':
     main()
+
@@ -0,0 +1,177 @@
+'''
+Shared configuration, logging and session helpers for the pt scripts
+'''
+import os
+import sys
+import gzip
+import json
+import queue
+import atexit
+import shutil
+import logging
+import contextlib
+
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler
+)
+
+BASE = os.path.dirname(os.path.realpath(__file__))
+
+logger = logging.getLogger(__name__)
+
+formatter = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+_configs = {}
+_handlers = []
+_listener = None
+_sessions = {}
+_stack = contextlib.ExitStack()
+
+def load(file: str) -> dict:
+    '''Load configuration from a JSON file, cached by modification time'''
+    if not os.path.isabs(file):
+        file = os.path.join(BASE, file)
+
+    try:
+        mtime = os.path.getmtime(file)
+    except OSError:
+        return None
+
+    cached = _configs.get(file)
+    if cached is None or cached[0] != mtime:
+        with open(file, 'r') as fp:
+            cached = (mtime, json.load(fp))
+        _configs[file] = cached
+
+    return dict(cached[1])
+
+def merge(args, *configs) -> None:
+    '''Fill unset arguments from the first configuration that provides them'''
+    for key, value in vars(args).items():
+        if value is not None:
+            continue
+
+        for config in configs:
+            if config and config.get(key) is not None:
+                setattr(args, key, config[key])
+                break
+
+class KV:
+    '''Structured key=value message, only formatted when emitted'''
+
+    __slots__ = ('fields',)
+
+    def __init__(self, **fields):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return ', '.join(f'{key}={value}' for key, value in self.fields.items())
+
+class Handler(QueueHandler):
+    '''Enqueue records with the message merged on the caller's thread'''
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the arguments may change once the caller moves on
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+def namer(name: str) -> str:
+    '''Name rotated log files as gzip archives'''
+    return f'{name}.gz'
+
+def rotator(source: str, dest: str) -> None:
+    '''Compress a rotated log file'''
+    with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+def file_handler(file: str) -> logging.Handler:
+    '''Create the rotating file handler configured in logging.json'''
+    config = load('logging.json') or {}
+    file = os.path.join(BASE, file)
+
+    if config.get('when'):
+        handler = TimedRotatingFileHandler(
+            file,
+            when=config['when'],
+            backupCount=config.get('backups', 7)
+        )
+    else:
+        handler = RotatingFileHandler(
+            file,
+            maxBytes=config.get('max_bytes', 10 * 1024 * 1024),
+            backupCount=config.get('backups', 5)
+        )
+
+    handler.namer = namer
+    handler.rotator = rotator
+
+    return handler
+
+def setup_logging(file: str = None, level: int = logging.INFO) -> None:
+    '''Route the root logger through a queue to the console and log file'''
+    global _listener
+
+    if _listener is None:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(formatter)
+        _handlers.append(stream_handler)
+
+        if file is not None:
+            handler = file_handler(file)
+            handler.setFormatter(formatter)
+            _handlers.append(handler)
+
+        # callers build the message, formatting and I/O run on the listener
+        records = queue.SimpleQueue()
+        logging.getLogger().addHandler(Handler(records))
+        _listener = QueueListener(
+            records,
+            *_handlers,
+            respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(_listener.stop)
+
+    logging.getLogger().setLevel(level)
+    for handler in _handlers:
+        handler.setLevel(level)
+
+def syno(ip: str, port: str, account: str, password: str):
+    '''Return a logged-in Synology client shared within this process'''
+    key = ('syno', ip, str(port), account)
+    if key not in _sessions:
+        from syno.api import Syno
+
+        _sessions[key] = _stack.enter_context(Syno(
+            ip=ip,
+            port=port,
+            account=account,
+            password=password
+        ))
+        logger.debug('action=login, ip=%s', ip)
+
+    return _sessions[key]
+
+def mt(key: str, output: str):
+    '''Return an M-Team client shared within this process'''
+    session = ('mt', key, output)
+    if session not in _sessions:
+        from mt.api import MT
+
+        _sessions[session] = _stack.enter_context(MT(key=key, output=output))
+
+    return _sessions[session]
+
+def close() -> None:
+    '''Close every session opened through this module'''
+    try:
+        _stack.close()
+    finally:
+        _sessions.clear()
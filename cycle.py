@@ -0,0 +1,175 @@
+'''
+Script to run check, clean and search on a single task snapshot
+'''
+import sys
+import logging
+import argparse
+
+import common
+import nodes
+import check
+import clean
+import search
+
+__description__ = 'Run check, clean and search in one pass'
+__epilog__ = 'Report bugs to <yehcj.tw@gmail.com>'
+
+logger = logging.getLogger(__name__)
+
+def arguments(parser: argparse.ArgumentParser) -> None:
+    '''Register the command line arguments'''
+    parser.add_argument(
+        '--ip',
+        type=str,
+        default=None,
+        help='Synology NAS IP address'
+    )
+    parser.add_argument(
+        '--port',
+        type=str,
+        default=None,
+        help='Synology NAS port'
+    )
+    parser.add_argument(
+        '--account',
+        type=str,
+        default=None,
+        help='Synology NAS user account'
+    )
+    parser.add_argument(
+        '--password',
+        type=str,
+        default=None,
+        help='Synology NAS user password'
+    )
+    parser.add_argument(
+        '--path',
+        type=str,
+        default=None,
+        help='Directory containing the torrent information files'
+    )
+    parser.add_argument(
+        '--key',
+        type=str,
+        default=None,
+        help='M-Team API key'
+    )
+    parser.add_argument(
+        '--output',
+        type=str,
+        default=None,
+        help='Output directory'
+    )
+    parser.add_argument(
+        '--mode',
+        choices=search.__choices__,
+        default=None,
+        help='Search mode (skip the search if not provided)'
+    )
+    parser.add_argument(
+        '--free',
+        action='store_true',
+        default=False,
+        help='Search for free torrents only'
+    )
+    parser.add_argument(
+        '--index',
+        type=int,
+        default=1,
+        help='Page number'
+    )
+    parser.add_argument(
+        '--size',
+        type=int,
+        default=25,
+        help='Page size'
+    )
+    parser.add_argument(
+        '--keyword',
+        type=str,
+        default=None,
+        help='Search keyword'
+    )
+    parser.add_argument(
+        '--rss',
+        type=str,
+        default=None,
+        help='RSS feed URL for the rss mode'
+    )
+    parser.add_argument(
+        '--limit',
+        type=int,
+        default=None,
+        help='Maximum number of downloading and waiting tasks on the NAS'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        default=False,
+        help='Download even if the torrent already exists'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Dry run mode'
+    )
+    parser.add_argument(
+        '--verbose',
+        action='store_true',
+        default=False,
+        help='Verbose mode (set log level to DEBUG)'
+    )
+
+def run(args) -> None:
+    '''Fetch one task snapshot and feed it to every step'''
+    config = common.load('synology.json')
+    common.merge(
+        args,
+        config,
+        common.load('mt.json'),
+        {'port': '5000'}
+    )
+
+    snapshot = nodes.poll(nodes.targets(
+        config,
+        ip=args.ip,
+        port=args.port,
+        account=args.account,
+        password=args.password
+    ))
+    logger.info('action=snapshot, count=%d', len(snapshot))
+
+    # Step 1: Lifecycle rules, deleted tasks are dropped from the snapshot
+    check.run(args, snapshot=snapshot)
+
+    # Step 2: History update and orphan cleanup on the remaining tasks
+    if args.output is not None:
+        clean.run(args, snapshot=snapshot)
+    else:
+        logger.warning('Skipping cleanup as no output directory is set')
+
+    # Step 3: Admit new downloads against what is already queued
+    if args.mode is not None:
+        search.run(args, snapshot=snapshot, limit=args.limit)
+
+def main():
+    '''Entry point: parse arguments'''
+    parser = argparse.ArgumentParser(
+        description=__description__,
+        epilog=__epilog__
+    )
+    arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    common.setup_logging(
+        file='app.log',
+        level=logging.DEBUG if args.verbose else logging.INFO
+    )
+
+    try:
+        run(args)
+    finally:
+        common.close()
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 import os
+import sys
 import shutil
 import argparse
 import logging
 from datetime import datetime
 
-logging.basicConfig(level=logging.INFO, format='%(message)s')
-logger = logging.getLogger()
+import common
+
+logger = logging.getLogger(__name__)
 
 def delete(
     path: str,
@@ -74,12 +76,8 @@ def delete(
         except Exception as e:
             logger.error('Error deleting %s: %s', target, str(e))
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(
-        description='Delete files based on creation date and keyword'
-    )
-
-    # Adding arguments
+def arguments(parser: argparse.ArgumentParser) -> None:
+    '''Register the command line arguments'''
     parser.add_argument(
         'path',
         type=str,
@@ -109,8 +107,8 @@ if __name__ == '__main__':
         help='List files to be deleted without actually deleting them'
     )
 
-    args = parser.parse_args()
-
+def run(args) -> None:
+    '''Delete the files selected by the arguments'''
     delete(
         path=args.path,
         date=args.date,
@@ -118,3 +116,17 @@ if __name__ == '__main__':
         keyword=args.keyword,
         dry_run=args.dry_run
     )
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Delete files based on creation date and keyword'
+    )
+    arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    common.setup_logging()
+
+    run(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,55 +1,20 @@
 '''
 Script to download specific torrents from M-Team by ID
 '''
-import os
 import sys
-import json
 import logging
 import argparse
 
-from mt.api import MT
+import common
+import nodes
 
 __description__ = 'Download M-Team torrents by torrent ID'
 __epilog__ = 'Report bugs to <yehcj.tw@gmail.com>'
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-file_handler = logging.FileHandler(os.path.join(
-    os.path.dirname(os.path.abspath(__file__)),
-    'app.log'
-))
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
-
-def load(file: str) -> dict:
-    '''Load configuration from a JSON file'''
-    if not os.path.exists(file):
-        return None
-    with open(file, 'r') as fp:
-        return json.load(fp)
-
-
-def main():
-    '''Entry point: parse arguments'''
-    global file_handler
-    global stream_handler
-
-    parser = argparse.ArgumentParser(
-        description=__description__,
-        epilog=__epilog__
-    )
+def arguments(parser: argparse.ArgumentParser) -> None:
+    '''Register the command line arguments'''
     parser.add_argument(
         '--id',
         type=str,
@@ -81,49 +46,77 @@ def main():
         default=False,
         help='Download even if the torrent already exists'
     )
-    args = parser.parse_args(sys.argv[1:])
 
-    # Apply log level to all handlers
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logger.setLevel(log_level)
-    file_handler.setLevel(log_level)
-    stream_handler.setLevel(log_level)
+def run(args) -> None:
+    '''Download the requested torrents'''
+    # leave the API key out of the log
+    logger.info('%s', common.KV(id=args.id, force=args.force))
 
-    logger.info('args=%s', args)
+    # Fall back to config values if not provided on the command line
+    common.merge(args, common.load('mt.json'))
 
-    # Load configuration from mt.json
-    config = load(os.path.join(
-        os.path.dirname(os.path.realpath(__file__)),
-        'mt.json'
-    ))
+    mt = common.mt(key=args.key, output=args.output)
 
-    # Fall back to config values if not provided on the command line
-    if args.key is None and config:
-        args.key = config.get('key')
-    if args.output is None and config:
-        args.output = config.get('output')
-
-    with MT(key=args.key, output=args.output) as mt:
-        for tid in args.id:
-            logger.info('tid=%s', tid)
-
-            # Skip if already downloaded (unless --force is set)
-            if not args.force and mt.exist(tid=tid):
-                logger.info('action=skip, reason=exist')
+    # Spread new torrents over the NAS nodes
+    placement = nodes.placement(
+        common.load('synology.json'),
+        watch=args.output
+    )
+
+    for tid in args.id:
+        logger.info('tid=%s', tid)
+
+        # Skip if already downloaded (unless --force is set)
+        if placement is not None:
+            exist = placement.exist(key=args.key, tid=tid)
+        else:
+            exist = mt.exist(tid=tid)
+        if not args.force and exist:
+            logger.info('action=skip, reason=exist')
+            continue
+
+        # Fetch detailed metadata if --verbose is requested or to place it
+        detail = None
+        if args.verbose or placement is not None:
+            detail = mt.detail(tid=tid)
+            if detail is not None and args.verbose:
+                logger.info(
+                    'name=%s, status=%s',
+                    detail['name'],
+                    detail['status']['discount']
+                )
+
+        target = mt
+        if placement is not None:
+            size = int((detail or {}).get('size') or 0)
+            node = placement.place(size=size)
+            if node is None:
+                logger.info('action=skip, reason=!space')
                 continue
+            logger.info('node=%s', node['name'])
+            target = common.mt(key=args.key, output=node['watch'])
+
+        target.download(tid=tid, detail=detail)
+
+def main():
+    '''Entry point: parse arguments'''
+    parser = argparse.ArgumentParser(
+        description=__description__,
+        epilog=__epilog__
+    )
+    arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    # Apply log level to all handlers
+    common.setup_logging(
+        file='app.log',
+        level=logging.DEBUG if args.verbose else logging.INFO
+    )
 
-            # Fetch detailed metadata if --verbose is requested
-            detail = None
-            if args.verbose:
-                detail = mt.detail(tid=tid)
-                if detail is not None:
-                    logger.info(
-                        'name=%s, status=%s',
-                        detail['name'],
-                        detail['status']['discount']
-                    )
-
-            mt.download(tid=tid, detail=detail)
+    try:
+        run(args)
+    finally:
+        common.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,138 @@
+'''
+Disk-pressure eviction of seeding tasks ranked by upload efficiency
+
+Configured by the "eviction" block of synology.json, e.g.:
+
+    {
+        "path": "/volume1/Download",
+        "threshold": 0.9,
+        "target": 0.85,
+        "window": 86400
+    }
+
+When the usage of the download volume reaches the threshold, the seeding
+tasks with the lowest upload per byte stored over the window are evicted
+until the projected usage drops below the target. The upload history
+comes from the transfer samples of the series store.
+
+With several nodes every node is evaluated on its own volume: a node
+may set its own "eviction" block, merged over the top-level one if any,
+e.g.
+{"name": "nas2", ..., "eviction": {"path": "/volume2/Download"}}.
+'''
+import shutil
+import logging
+
+import rules
+import series
+
+logger = logging.getLogger(__name__)
+
+def value(
+    samples: list,
+    size: float,
+    uploaded: float,
+    seeding_time: float,
+    now: float,
+    window: float
+) -> float:
+    '''Bytes uploaded per byte stored, scaled to one window'''
+    if size <= 0:
+        return 0.0
+
+    if len(samples) > 1:
+        return series.rate(samples, since=now - window) * window / size
+
+    # a single poll: fall back to the average since completion
+    if seeding_time > 0:
+        return uploaded / size * window / seeding_time
+
+    return 0.0
+
+def usage(path: str) -> tuple:
+    '''Return the used and total bytes of the volume holding path'''
+    disk = shutil.disk_usage(path)
+    return disk.used, disk.total
+
+def blocks(config: dict, nodes: list) -> dict:
+    '''Map every node with eviction enabled to its merged configuration'''
+    default = (config or {}).get('eviction')
+    found = {}
+    for node in nodes:
+        if default is None and not node.get('eviction'):
+            continue
+        found[node['name']] = {
+            **(default or {}),
+            **(node.get('eviction') or {})
+        }
+
+    return found
+
+def evaluate(
+    config: dict,
+    table: rules.Table,
+    picked: dict,
+    history: dict,
+    now: float,
+    node: str = None
+) -> dict:
+    '''Pick the least efficient seeding tasks while the node's disk is full'''
+    window = config.get('window', 86400)
+    threshold = config.get('threshold', 0.9)
+    target = config.get('target', threshold)
+
+    if not config.get('path'):
+        logger.error('node=%s, action=skip, reason=!eviction.path', node)
+        return {}
+
+    try:
+        used, total = usage(config['path'])
+    except OSError as e:
+        logger.error('node=%s, action=skip, reason=%s', node, e)
+        return {}
+
+    logger.debug('node=%s, used=%d, total=%d', node, used, total)
+    if total <= 0 or used / total < threshold:
+        return {}
+
+    size = table['size']
+    uploaded = table['uploaded']
+    seeding_time = table['seeding_time']
+    candidates = []
+    for index in rules.Rule(
+        name='evict',
+        action='delete',
+        when={'status': ['seeding']}
+    ).evaluate(table):
+        if node is not None and table.tasks[index].node != node:
+            continue
+
+        # tasks already being deleted free their space anyway
+        if picked.get(index, ('',))[0] == 'delete':
+            used -= size[index]
+            continue
+
+        candidates.append((
+            value(
+                history.get(table.tid[index], []),
+                size=size[index],
+                uploaded=uploaded[index],
+                seeding_time=seeding_time[index],
+                now=now,
+                window=window
+            ),
+            index
+        ))
+
+    evicted = {}
+    for efficiency, index in sorted(candidates):
+        if used <= target * total:
+            break
+
+        used -= size[index]
+        evicted[index] = (
+            'delete',
+            [f'evict(value={efficiency:g}, usage={used / total:.2f})']
+        )
+
+    return evicted
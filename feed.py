@@ -0,0 +1,112 @@
+'''
+Incremental fetching of the rss and waterfall search modes
+
+The cursor of every feed (ETag, Last-Modified and the newest item seen)
+is kept in feeds.json. An unchanged RSS feed costs one 304 round trip, a
+changed one is parsed as a stream and only up to the last item seen.
+'''
+import os
+import re
+import json
+import logging
+
+from xml.etree.ElementTree import iterparse
+
+import common
+
+logger = logging.getLogger(__name__)
+
+FILE = os.path.join(common.BASE, 'feeds.json')
+
+def load(file: str = FILE) -> dict:
+    '''Load the cursor of every feed'''
+    if not os.path.exists(file):
+        return {}
+
+    try:
+        with open(file, 'r') as fp:
+            return json.load(fp)
+    except ValueError as e:
+        logger.warning('file=%s, action=reset, reason=%s', file, e)
+        return {}
+
+def save(cursors: dict, file: str = FILE) -> None:
+    '''Persist the cursor of every feed'''
+    temp = f'{file}.tmp'
+    with open(temp, 'w') as fp:
+        json.dump(cursors, fp, indent=4)
+    os.replace(temp, file)
+
+def tid(text: str) -> str:
+    '''Extract the torrent ID from an item link or guid'''
+    match = re.search(r'(\d+)\D*$', text or '')
+    return match.group(1) if match else None
+
+def parse(stream, last: str = None) -> list:
+    '''Parse RSS items newest first, stopping at the last item seen'''
+    items = []
+    for _, element in iterparse(stream, events=('end',)):
+        if element.tag != 'item':
+            continue
+
+        guid = element.findtext('guid') or element.findtext('link')
+        if last is not None and guid == last:
+            break
+
+        items.append({
+            'id': tid(element.findtext('link')) or tid(guid),
+            'title': element.findtext('title'),
+            'guid': guid
+        })
+        element.clear()
+
+    return items
+
+def fetch(url: str, cursor: dict, timeout: int = 30) -> list:
+    '''Conditionally fetch the new items of an RSS feed'''
+    import requests
+
+    headers = {}
+    if cursor.get('etag'):
+        headers['If-None-Match'] = cursor['etag']
+    if cursor.get('modified'):
+        headers['If-Modified-Since'] = cursor['modified']
+
+    with requests.get(
+        url,
+        headers=headers,
+        stream=True,
+        timeout=timeout
+    ) as response:
+        if response.status_code == 304:
+            logger.info('action=skip, reason=unmodified')
+            return []
+        response.raise_for_status()
+
+        response.raw.decode_content = True
+        items = parse(response.raw, last=cursor.get('last'))
+
+        cursor['etag'] = response.headers.get('ETag')
+        cursor['modified'] = response.headers.get('Last-Modified')
+
+    if items:
+        cursor['last'] = items[0]['guid']
+    logger.info('action=fetch, count=%d', len(items))
+
+    return items
+
+def since(items: list, cursor: dict) -> list:
+    '''Keep the items listed before the last one seen'''
+    last = cursor.get('last')
+
+    fresh = []
+    for item in items:
+        if last is not None and str(item['id']) == last:
+            break
+        fresh.append(item)
+
+    if fresh:
+        cursor['last'] = str(fresh[0]['id'])
+    logger.info('action=since, count=%d', len(fresh))
+
+    return fresh
@@ -0,0 +1,201 @@
+'''
+Index of known torrents by infohash and by (name, size)
+
+The index is filled from the .torrent files in the watch directories and
+from the NAS task list, and kept in index.json. Only torrent files that
+are new or modified since the last scan are decoded. Torrents withdrawn
+as duplicates are remembered by tid so they are not fetched again.
+'''
+import os
+import glob
+import json
+import hashlib
+import logging
+
+import common
+import tasks
+
+logger = logging.getLogger(__name__)
+
+FILE = os.path.join(common.BASE, 'index.json')
+
+def skip(data: bytes, i: int) -> int:
+    '''Return the offset right after the bencoded value at i'''
+    c = data[i]
+    if c == 0x69:  # i<int>e
+        return data.index(b'e', i) + 1
+    if c in (0x6c, 0x64):  # l...e / d...e
+        i += 1
+        while data[i] != 0x65:
+            i = skip(data, i)
+        return i + 1
+
+    colon = data.index(b':', i)
+    return colon + 1 + int(data[i:colon])
+
+def decode(data: bytes, i: int = 0) -> tuple:
+    '''Decode the bencoded value at i, returning it and the next offset'''
+    c = data[i]
+    if c == 0x69:
+        end = data.index(b'e', i)
+        return int(data[i + 1:end]), end + 1
+    if c == 0x6c:
+        i += 1
+        values = []
+        while data[i] != 0x65:
+            value, i = decode(data, i)
+            values.append(value)
+        return values, i + 1
+    if c == 0x64:
+        i += 1
+        values = {}
+        while data[i] != 0x65:
+            key, i = decode(data, i)
+            values[key], i = decode(data, i)
+        return values, i + 1
+
+    colon = data.index(b':', i)
+    start = colon + 1
+    end = start + int(data[i:colon])
+    return data[start:end], end
+
+def inspect(data: bytes) -> tuple:
+    '''Return the infohash, name and total size of a torrent file'''
+    if data[:1] != b'd':
+        raise ValueError('not a bencoded dictionary')
+
+    i = 1
+    while data[i] != 0x65:
+        key, i = decode(data, i)
+        end = skip(data, i)
+        if key == b'info':
+            info, _ = decode(data[i:end])
+            name = info.get(b'name.utf-8', info.get(b'name', b''))
+            size = info.get(b'length')
+            if size is None:
+                size = sum(f.get(b'length', 0) for f in info.get(b'files', []))
+            return (
+                hashlib.sha1(data[i:end]).hexdigest(),
+                name.decode('utf-8', 'replace'),
+                size
+            )
+        i = end
+
+    raise ValueError('missing info dictionary')
+
+def key(name: str, size) -> str:
+    '''Key of the (name, size) lookup'''
+    return f'{name}|{int(size)}'
+
+class Index:
+    '''Infohash and (name, size) to tid lookups'''
+
+    def __init__(self, file: str = FILE):
+        self.file = file
+        self.hashes = {}
+        self.names = {}
+        self.aliases = {}
+        self.files = {}
+
+        if os.path.exists(file):
+            try:
+                with open(file, 'r') as fp:
+                    state = json.load(fp)
+                self.hashes = state.get('hashes', {})
+                self.names = state.get('names', {})
+                self.aliases = state.get('aliases', {})
+                self.files = state.get('files', {})
+            except ValueError as e:
+                logger.warning('file=%s, action=reset, reason=%s', file, e)
+
+    def save(self) -> None:
+        '''Persist the index'''
+        temp = f'{self.file}.tmp'
+        with open(temp, 'w') as fp:
+            json.dump({
+                'hashes': self.hashes,
+                'names': self.names,
+                'aliases': self.aliases,
+                'files': self.files
+            }, fp)
+        os.replace(temp, self.file)
+
+    def add(self, tid: str, infohash: str = None, name: str = None, size=None):
+        '''Record a known torrent, keeping the first tid seen'''
+        if infohash is not None:
+            self.hashes.setdefault(infohash, tid)
+        if name and size:
+            self.names.setdefault(key(name, size), tid)
+
+    def claim(self, file: str) -> str:
+        '''Index a new torrent file, returning the tid it duplicates'''
+        tid = os.path.basename(file).split('.', 1)[0]
+        try:
+            with open(file, 'rb') as fp:
+                infohash, name, size = inspect(fp.read())
+        except (OSError, ValueError, IndexError) as e:
+            logger.warning('file=%s, action=skip, reason=%s', file, e)
+            return None
+
+        found = self.hashes.get(infohash)
+        if found is not None and found != tid:
+            self.aliases[tid] = found
+            return found
+
+        self.add(tid, infohash=infohash, name=name, size=size)
+        self.files[file] = os.path.getmtime(file)
+
+        return None
+
+    def scan(self, path: str) -> int:
+        '''Decode the torrent files that are new since the last scan'''
+        pattern = os.path.join(path, '*.torrent*')
+        files = glob.glob(pattern)
+
+        # forget the files that were deleted since the last scan
+        folder = os.path.dirname(pattern)
+        for file in set(self.files).difference(files):
+            if os.path.dirname(file) == folder:
+                del self.files[file]
+
+        count = 0
+        for file in files:
+            try:
+                mtime = os.path.getmtime(file)
+            except OSError:
+                continue
+            if self.files.get(file) == mtime:
+                continue
+
+            self.claim(file)
+            self.files[file] = mtime
+            count += 1
+
+        logger.debug('path=%s, action=scan, count=%d', path, count)
+
+        return count
+
+    def update(self, snapshot: tasks.Snapshot) -> None:
+        '''Record the name and size of every task on the NAS'''
+        for task in snapshot:
+            self.add(task.tid, name=task.title, size=task.size)
+
+    def alias(self, tid: str) -> str:
+        '''Return the tid a withdrawn torrent duplicates'''
+        return self.aliases.get(str(tid))
+
+    def duplicate(self, tid: str, detail: dict) -> str:
+        '''Return the tid already known under the name and size of detail'''
+        size = detail.get('size')
+        if not size:
+            return None
+
+        for name in (
+            (detail.get('originFileName') or '').replace('.torrent', ''),
+            detail.get('name')
+        ):
+            found = self.names.get(key(name, size)) if name else None
+            if found is not None and found != str(tid):
+                return found
+
+        return None
@@ -0,0 +1,204 @@
+'''
+Multiple Synology Download Station targets
+
+synology.json either describes a single NAS at the top level or lists
+several of them under "nodes", e.g.:
+
+    {
+        "nodes": [
+            {
+                "name": "nas1",
+                "ip": "192.168.1.10",
+                "account": "admin",
+                "password": "yourpassword",
+                "path": "/volume1/Torrent/info",
+                "watch": "/volume1/Torrent/watch"
+            },
+            ...
+        ]
+    }
+
+All nodes are polled concurrently into one snapshot, and new torrents
+are placed on the node with the lowest load that has room for them.
+'''
+import shutil
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+import common
+import tasks
+
+logger = logging.getLogger(__name__)
+
+# Download speed counted as one extra active task when placing torrents
+SPEED = 10 * 1024 * 1024
+
+def targets(
+    config: dict,
+    ip: str = None,
+    port: str = None,
+    account: str = None,
+    password: str = None,
+    path: str = None,
+    watch: str = None
+) -> list:
+    '''Return the configured nodes, or a single one from the arguments'''
+    config = config or {}
+    if ip is None and config.get('nodes'):
+        nodes = []
+        for node in config['nodes']:
+            node = {
+                'port': port or '5000',
+                'account': account,
+                'password': password,
+                'path': path,
+                'watch': watch,
+                **node
+            }
+            node.setdefault('name', node['ip'])
+            nodes.append(node)
+        return nodes
+
+    return [{
+        'name': ip,
+        'ip': ip,
+        'port': port or '5000',
+        'account': account,
+        'password': password,
+        'path': path,
+        'watch': watch
+    }]
+
+def configured(config: dict, watch: str = None) -> list:
+    '''Return the nodes of synology.json, inheriting its top-level settings'''
+    config = config or {}
+    return targets(
+        config,
+        ip=None if config.get('nodes') else config.get('ip'),
+        port=config.get('port'),
+        account=config.get('account'),
+        password=config.get('password'),
+        path=config.get('path'),
+        watch=watch
+    )
+
+def session(node: dict):
+    '''Return the logged-in client of a node'''
+    return common.syno(
+        ip=node['ip'],
+        port=node['port'],
+        account=node['account'],
+        password=node['password']
+    )
+
+def fetch(node: dict) -> tasks.Snapshot:
+    '''Fetch the task list of one node, tagging every task with it'''
+    return tasks.fetch(session(node), node=node['name'])
+
+def poll(nodes: list) -> tasks.Snapshot:
+    '''Fetch the task lists of all nodes concurrently into one snapshot'''
+    if len(nodes) == 1:
+        return fetch(nodes[0])
+
+    merged = []
+    failed = set()
+    with ThreadPoolExecutor(max_workers=len(nodes)) as executor:
+        futures = {node['name']: executor.submit(fetch, node) for node in nodes}
+        for name, future in futures.items():
+            try:
+                snapshot = future.result()
+            except Exception as e:
+                logger.error('node=%s, action=skip, reason=%s', name, e)
+                failed.add(name)
+                continue
+
+            logger.info('node=%s, count=%d', name, len(snapshot))
+            merged.extend(snapshot.tasks)
+
+    snapshot = tasks.Snapshot(merged)
+    snapshot.failed = failed
+
+    return snapshot
+
+def group(nodes: list, picked: list) -> list:
+    '''Pair every node with the picked tasks that belong to it'''
+    default = nodes[0]['name']
+    return [
+        (node, [t for t in picked if (t.node or default) == node['name']])
+        for node in nodes
+    ]
+
+class Placement:
+    '''Load of every node, updated as torrents are placed'''
+
+    def __init__(self, nodes: list, snapshot: tasks.Snapshot = None):
+        self.nodes = [node for node in nodes if node.get('watch')]
+        self.active = {node['name']: 0 for node in self.nodes}
+        self.speed = {node['name']: 0 for node in self.nodes}
+        self.free = {}
+        # task list the loads were computed from
+        self.snapshot = snapshot
+
+        for node in self.nodes:
+            try:
+                self.free[node['name']] = shutil.disk_usage(node['watch']).free
+            except OSError as e:
+                logger.warning('node=%s, action=skip, reason=%s', node['name'], e)
+
+        default = self.nodes[0]['name'] if self.nodes else None
+        for task in snapshot or []:
+            name = task.node or default
+            if name not in self.active:
+                continue
+            if task.status in ('downloading', 'waiting'):
+                self.active[name] += 1
+            self.speed[name] += task.download_speed
+
+    def load(self, name: str) -> float:
+        '''Active tasks plus the throughput in task equivalents'''
+        return self.active[name] + self.speed[name] / SPEED
+
+    def place(self, size: int = 0) -> dict:
+        '''Pick the least loaded node with room for the torrent'''
+        candidates = [
+            node for node in self.nodes
+            if self.free.get(node['name'], 0) > size
+        ]
+        if not candidates:
+            return None
+
+        node = min(
+            candidates,
+            key=lambda n: (self.load(n['name']), -self.free[n['name']])
+        )
+        self.active[node['name']] += 1
+        self.free[node['name']] -= size
+        logger.debug('node=%s, action=place, size=%d', node['name'], size)
+
+        return node
+
+    def exist(self, key: str, tid: str) -> bool:
+        '''Check whether the torrent was already placed on any node'''
+        return any(
+            common.mt(key=key, output=node['watch']).exist(tid=tid)
+            for node in self.nodes
+        )
+
+def placement(
+    config: dict,
+    watch: str,
+    snapshot: tasks.Snapshot = None
+) -> Placement:
+    '''Return the placement of new torrents when several nodes are set'''
+    found = configured(config, watch=watch)
+    if len(found) < 2:
+        return None
+
+    if snapshot is None:
+        try:
+            snapshot = poll(found)
+        except Exception as e:
+            logger.warning('action=place, reason=%s', e)
+
+    return Placement(found, snapshot)
@@ -0,0 +1,75 @@
+'''
+Unified entry point running one or more pt commands in a single process
+
+Commands are separated by a standalone "+" and share configuration and
+sessions, e.g.:
+
+    python3 pt.py check --dry-run + clean --output /path + search --mode movie
+'''
+import sys
+import logging
+import argparse
+import importlib
+
+import common
+
+__description__ = 'PT management tools'
+__epilog__ = 'Report bugs to <yehcj.tw@gmail.com>'
+__commands__ = {
+    'check': 'Synology Download Station Task Manager',
+    'clean': 'Clean up orphaned torrent metadata files',
+    'search': 'Search and download torrents from M-Team',
+    'download': 'Download M-Team torrents by torrent ID',
+    'delete': 'Delete files based on creation date and keyword',
+    'cycle': 'Run check, clean and search in one pass'
+}
+
+def split(argv: list) -> list:
+    '''Split the command line into one argument list per command'''
+    segments = [[]]
+    for arg in argv:
+        if arg == '+':
+            segments.append([])
+        else:
+            segments[-1].append(arg)
+
+    return [segment for segment in segments if segment]
+
+def parser() -> argparse.ArgumentParser:
+    '''Build the parser with one sub-parser per command'''
+    parser = argparse.ArgumentParser(
+        description=__description__,
+        epilog=__epilog__
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, description in __commands__.items():
+        subparser = subparsers.add_parser(
+            command,
+            help=description,
+            description=description
+        )
+        importlib.import_module(command).arguments(subparser)
+
+    return parser
+
+def main():
+    '''Entry point: parse every command before running any of them'''
+    segments = split(sys.argv[1:]) or [['--help']]
+
+    cli = parser()
+    commands = [cli.parse_args(segment) for segment in segments]
+
+    verbose = any(getattr(args, 'verbose', False) for args in commands)
+    common.setup_logging(
+        file='app.log',
+        level=logging.DEBUG if verbose else logging.INFO
+    )
+
+    try:
+        for args in commands:
+            importlib.import_module(args.command).run(args)
+    finally:
+        common.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+'''
+Declarative rule engine for Synology Download Station task lifecycle
+
+Rules are read from the "rules" list of synology.json, e.g.:
+
+    {
+        "name": "seeding",
+        "action": "delete",
+        "when": {
+            "status": ["seeding"],
+            "completed": true,
+            "seeding_time": {">": 604800}
+        },
+        "categories": {
+            "401": {"seeding_time": {">": 1209600}}
+        }
+    }
+
+Every condition of a rule must hold for a task to be picked. A list is a
+shorthand for "in" and a scalar for "==". Per-category overrides are
+merged into the conditions of the rule for tasks of that M-Team category.
+'''
+import os
+import json
+import logging
+import operator
+
+from array import array
+from datetime import datetime
+from itertools import compress, repeat
+
+import series
+import tasks
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('delete', 'resume')
+
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda x, y: x in y,
+    'not in': lambda x, y: x not in y
+}
+
+NUMERIC = (
+    'size',
+    'downloaded',
+    'uploaded',
+    'ratio',
+    'download_speed',
+    'upload_speed',
+    'downloaded_pieces',
+    'elapsed',
+    'seeding_time',
+    'completed',
+    'discount_left',
+    'stalled',
+    'upload_rate'
+)
+
+TEXT = (
+    'status',
+    'discount',
+    'category'
+)
+
+# Fields read from the M-Team information file of a task
+META = (
+    'discount',
+    'discount_left',
+    'category'
+)
+
+DEFAULT_RULES = [
+    {
+        'name': 'stuck',
+        'action': 'delete',
+        'when': {
+            'status': ['downloading'],
+            'downloaded_pieces': {'==': 0},
+            'elapsed': {'>': 3600}
+        }
+    },
+    {
+        'name': 'stalled',
+        'action': 'delete',
+        'when': {
+            'status': ['downloading'],
+            'stalled': {'>': 3 * 3600}
+        }
+    },
+    {
+        'name': '!free',
+        'action': 'delete',
+        'when': {
+            'status': ['downloading', 'waiting'],
+            'completed': False,
+            'discount_left': {'<': 300}
+        }
+    },
+    {
+        'name': 'error',
+        'action': 'resume',
+        'when': {
+            'status': ['error']
+        }
+    },
+    {
+        'name': 'seeding_over_7_days',
+        'action': 'delete',
+        'when': {
+            'status': ['seeding'],
+            'completed': True,
+            'seeding_time': {'>': 7 * 86400}
+        }
+    }
+]
+
+def info(path: str, tid: str) -> dict:
+    '''Read the M-Team information file of a task'''
+    if path is None:
+        return None
+
+    file = os.path.join(path, f'{tid}.info')
+    if not os.path.exists(file):
+        return None
+
+    try:
+        with open(file, 'r') as fp:
+            return json.load(fp) or {}
+    except ValueError as e:
+        logger.warning('file=%s, action=pass, reason=%s', file, e)
+        return None
+
+def statuses(rules: list) -> frozenset:
+    '''Task states whose information file a rule may need, None for all'''
+    needed = set()
+    for rule in rules:
+        if not any(field in META for field, _, _ in rule.conditions):
+            continue
+
+        allowed = rule.statuses()
+        if allowed is None:
+            return None
+        needed |= allowed
+
+    return frozenset(needed)
+
+class Table:
+    '''Column-oriented view of a task snapshot'''
+
+    def __init__(
+        self,
+        snapshot: tasks.Snapshot,
+        paths: dict,
+        now: float,
+        rules: list = None
+    ):
+        self.tasks = []
+        self.tid = []
+        self.columns = {name: array('d') for name in NUMERIC}
+        self.columns.update({name: [] for name in TEXT})
+
+        # only read the information files of rows a rule can pick
+        self.needed = statuses(rules) if rules is not None else None
+
+        for task in snapshot:
+            self.append(task, path=paths.get(task.node), now=now)
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def __getitem__(self, name: str):
+        return self.columns[name]
+
+    def append(self, task: tasks.Task, path: str, now: float) -> None:
+        '''Add the columns of a task as one row of the table'''
+        started = task.started_time
+        if started <= 0:
+            started = task.create_time
+        completed = task.completed_time
+
+        # Seconds left in the free window: unknown torrents are left alone,
+        # torrents without an end time are not free at all
+        meta = None
+        if self.needed is None or task.status in self.needed:
+            meta = info(path, task.tid)
+        discount = ''
+        discount_left = float('inf')
+        category = ''
+        if meta is not None:
+            status = meta.get('status') or {}
+            discount = status.get('discount') or ''
+            category = str(meta.get('category') or '')
+            end = status.get('discountEndTime')
+            discount_left = 0.0
+            if end is not None:
+                discount_left = datetime.strptime(
+                    end,
+                    '%Y-%m-%d %H:%M:%S'
+                ).timestamp() - now
+
+        self.tasks.append(task)
+        self.tid.append(task.tid)
+
+        row = {
+            'size': task.size,
+            'downloaded': task.downloaded,
+            'uploaded': task.uploaded,
+            'ratio': task.uploaded / (task.downloaded or task.size or 1),
+            'download_speed': task.download_speed,
+            'upload_speed': task.upload_speed,
+            'downloaded_pieces': task.downloaded_pieces,
+            'elapsed': now - started,
+            'seeding_time': now - completed if completed > 0 else 0,
+            'completed': completed > 0,
+            'discount_left': discount_left,
+            'stalled': 0,
+            'upload_rate': 0,
+            'status': task.status,
+            'discount': discount,
+            'category': category
+        }
+        for name, value in row.items():
+            self.columns[name].append(value)
+
+    def attach(
+        self,
+        history: dict,
+        now: float,
+        count: int,
+        window: float
+    ) -> None:
+        '''Fill the columns derived from the transfer history'''
+        # a task only stalls once started, not while it was still queued
+        self.columns['stalled'] = array('d', (
+            min(
+                series.stalled(history.get(tid, []), now=now, count=count),
+                elapsed
+            )
+            for tid, elapsed in zip(self.tid, self.columns['elapsed'])
+        ))
+        self.columns['upload_rate'] = array('d', (
+            series.rate(history.get(tid, []), since=now - window)
+            for tid in self.tid
+        ))
+
+class Rule:
+    '''Conjunction of conditions compiled against the table columns'''
+
+    def __init__(self, name: str, action: str, when: dict):
+        if action not in ACTIONS:
+            raise ValueError(f'rule {name}: unknown action {action}')
+
+        self.name = name
+        self.action = action
+        self.conditions = []
+        for field, condition in when.items():
+            if field not in NUMERIC and field not in TEXT:
+                raise ValueError(f'rule {name}: unknown field {field}')
+
+            if isinstance(condition, list):
+                condition = {'in': condition}
+            elif not isinstance(condition, dict):
+                condition = {'==': condition}
+
+            for op, value in condition.items():
+                if op not in OPERATORS:
+                    raise ValueError(f'rule {name}: unknown operator {op}')
+                if isinstance(value, list):
+                    value = frozenset(value)
+                self.conditions.append((field, op, value))
+
+    def statuses(self) -> set:
+        '''Task states the rule can match, None if it is not limited'''
+        allowed = None
+        for field, op, value in self.conditions:
+            if field != 'status' or op not in ('==', 'in'):
+                continue
+
+            value = {value} if op == '==' else set(value)
+            allowed = value if allowed is None else allowed & value
+
+        return allowed
+
+    def evaluate(self, table: Table) -> list:
+        '''Return the row indices matching every condition'''
+        mask = None
+        for field, op, value in self.conditions:
+            column = map(OPERATORS[op], table[field], repeat(value))
+            if mask is None:
+                mask = list(column)
+            else:
+                mask = list(map(operator.and_, mask, column))
+
+        if mask is None:
+            return list(range(len(table)))
+
+        return list(compress(range(len(table)), mask))
+
+    def explain(self, table: Table, index: int) -> str:
+        '''Describe why a row was picked'''
+        values = ', '.join(
+            f'{field}={table[field][index]:g}'
+            if field in NUMERIC else f'{field}={table[field][index]}'
+            for field in dict.fromkeys(f for f, _, _ in self.conditions)
+        )
+        return f'{self.name}({values})'
+
+def build(config: list = None) -> list:
+    '''Compile rule definitions, expanding the per-category overrides'''
+    compiled = []
+    for definition in config or DEFAULT_RULES:
+        name = definition['name']
+        action = definition['action']
+        when = dict(definition.get('when', {}))
+        categories = definition.get('categories', {})
+
+        if categories:
+            for category, override in categories.items():
+                compiled.append(Rule(
+                    name=f'{name}[{category}]',
+                    action=action,
+                    when={**when, **override, 'category': {'==': category}}
+                ))
+            when['category'] = {'not in': list(categories)}
+
+        compiled.append(Rule(name=name, action=action, when=when))
+
+    return compiled
+
+def evaluate(rules: list, table: Table) -> dict:
+    '''Map the picked row indices to their action and reasons'''
+    picked = {}
+    for rule in rules:
+        for index in rule.evaluate(table):
+            action, reasons = picked.get(index, (rule.action, []))
+            # deletion wins over any other action
+            if rule.action == 'delete':
+                action = 'delete'
+            reasons.append(rule.explain(table, index))
+            picked[index] = (action, reasons)
+
+    return picked
@@ -0,0 +1,72 @@
+'''
+Expiry-ordered scheduling of free-leech downloads
+
+Every candidate gets an estimated finish time from its size and seeders.
+Candidates that cannot finish before their free window ends are dropped,
+the others are downloaded least slack first.
+
+Tunable through the "schedule" block of mt.json, e.g.:
+
+    {
+        "seeder_speed": 524288,
+        "max_speed": 20971520
+    }
+'''
+import heapq
+import logging
+
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Download speed expected from each seeder and in total, in bytes/s
+SEEDER_SPEED = 512 * 1024
+MAX_SPEED = 20 * 1024 * 1024
+
+def remaining(detail: dict, now: float) -> float:
+    '''Seconds left in the free window, infinite if it does not end'''
+    end = (detail.get('status') or {}).get('discountEndTime')
+    if end is None:
+        return float('inf')
+
+    return datetime.strptime(end, '%Y-%m-%d %H:%M:%S').timestamp() - now
+
+def finish(detail: dict, config: dict) -> float:
+    '''Estimated seconds to download the torrent'''
+    size = int(detail.get('size') or 0)
+    seeders = int((detail.get('status') or {}).get('seeders') or 0)
+    if seeders <= 0:
+        return float('inf') if size > 0 else 0.0
+
+    speed = min(
+        seeders * config.get('seeder_speed', SEEDER_SPEED),
+        config.get('max_speed', MAX_SPEED)
+    )
+    return size / speed
+
+def order(candidates: list, now: float, config: dict = None) -> list:
+    '''Drop what cannot finish in time and sort the rest by slack'''
+    config = config or {}
+
+    heap = []
+    for position, (tid, detail) in enumerate(candidates):
+        eta = finish(detail, config)
+        window = remaining(detail, now)
+        if eta > window:
+            logger.info(
+                'tid=%s, action=skip, reason=expiry, eta=%ds, window=%ds',
+                tid,
+                min(eta, 10 ** 9),
+                window
+            )
+            continue
+
+        slack = window - eta if window != float('inf') else window
+        heapq.heappush(heap, (slack, eta, position, tid, detail))
+
+    return [
+        (tid, detail)
+        for _, _, _, tid, detail in (
+            heapq.heappop(heap) for _ in range(len(heap))
+        )
+    ]
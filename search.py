@@ -3,11 +3,16 @@ Script to search and download torrents from M-Team
 '''
 import os
 import sys
-import json
+import time
 import logging
 import argparse
 
-from mt.api import MT
+import common
+import feed
+import index
+import nodes
+import schedule
+import tasks
 
 __description__ = 'Search and download torrents from M-Team'
 __epilog__ = 'Report bugs to <yehcj.tw@gmail.com>'
@@ -22,44 +27,10 @@ __choices__ = {
     'rankings'
 }
 
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = logging.getLogger(__name__)
 
-formatter = logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-
-file_handler = logging.FileHandler(os.path.join(
-    os.path.dirname(os.path.abspath(__file__)),
-    'app.log'
-))
-file_handler.setLevel(logging.INFO)
-file_handler.setFormatter(formatter)
-
-stream_handler = logging.StreamHandler(sys.stdout)
-stream_handler.setLevel(logging.INFO)
-stream_handler.setFormatter(formatter)
-
-logger.addHandler(file_handler)
-logger.addHandler(stream_handler)
-
-def load(file: str) -> dict:
-    '''Load configuration from a JSON file'''
-    if not os.path.exists(file):
-        return None
-    with open(file, 'r') as fp:
-        return json.load(fp)
-
-
-def main():
-    '''Entry point: parse arguments'''
-    global file_handler
-    global stream_handler
-
-    parser = argparse.ArgumentParser(
-        description=__description__,
-        epilog=__epilog__
-    )
+def arguments(parser: argparse.ArgumentParser) -> None:
+    '''Register the command line arguments'''
     parser.add_argument(
         '--key',
         type=str,
@@ -102,6 +73,12 @@ def main():
         default=None,
         help='Search keyword'
     )
+    parser.add_argument(
+        '--rss',
+        type=str,
+        default=None,
+        help='RSS feed URL for the rss mode'
+    )
     parser.add_argument(
         '--verbose',
         action='store_true',
@@ -114,29 +91,53 @@ def main():
         default=False,
         help='Download even if the torrent already exists'
     )
-    args = parser.parse_args(sys.argv[1:])
-
-    # Apply log level to all handlers
-    log_level = logging.DEBUG if args.verbose else logging.INFO
-    logger.setLevel(log_level)
-    file_handler.setLevel(log_level)
-    stream_handler.setLevel(log_level)
-
-    logger.info('args=%s', args)
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        default=False,
+        help='Dry run mode (do not download torrents)'
+    )
 
-    # Load configuration from mt.json
-    config = load(os.path.join(
-        os.path.dirname(os.path.realpath(__file__)),
-        'mt.json'
+def run(
+    args,
+    snapshot: tasks.Snapshot = None,
+    limit: int = None
+) -> None:
+    '''Search M-Team and download the matching torrents'''
+    # the namespace may hold credentials merged by cycle, log the query only
+    logger.info('%s', common.KV(
+        mode=args.mode,
+        free=args.free,
+        keyword=args.keyword,
+        index=args.index,
+        size=args.size
     ))
 
     # Fall back to config values if not provided on the command line
-    if args.key is None and config:
-        args.key = config.get('key')
-    if args.output is None and config:
-        args.output = config.get('output')
+    common.merge(args, common.load('mt.json'))
 
-    with MT(key=args.key, output=args.output) as mt:
+    mt = common.mt(key=args.key, output=args.output)
+
+    # Feeds only return what is new since the persisted cursor
+    cursors = None
+    if args.mode in ('rss', 'waterfall'):
+        cursors = feed.load()
+        # a listing is only comparable with the same query and page
+        cursor = cursors.setdefault(
+            args.rss if args.mode == 'rss' and args.rss
+            else ':'.join(str(value) for value in (
+                args.mode,
+                args.keyword or '',
+                'free' if args.free else 'all',
+                args.index,
+                args.size
+            )),
+            {}
+        )
+
+    if args.mode == 'rss' and args.rss is not None:
+        items = feed.fetch(args.rss, cursor)
+    else:
         items = mt.search(
             mode=args.mode,
             free=args.free,
@@ -146,35 +147,177 @@ def main():
         )
         if items is None:
             return
+        if cursors is not None:
+            items = feed.since(items, cursor)
 
-        for item in items:
-            tid = item['id']
-            logger.info('tid=%s', tid)
+    # Nothing new: skip the NAS poll and the index scan
+    if not items:
+        logger.info('action=stop, reason=!new')
+        if cursors is not None and not args.dry_run:
+            feed.save(cursors)
+        return
 
-            # Skip if already downloaded (unless --force is set)
-            if not args.force and mt.exist(tid=tid):
-                logger.info('action=skip, reason=exist')
-                continue
+    # Spread new torrents over the NAS nodes
+    synology = common.load('synology.json')
+    placement = nodes.placement(
+        synology,
+        watch=args.output,
+        snapshot=snapshot
+    )
 
-            # Fetch detailed metadata
-            detail = mt.detail(tid=tid)
-            if detail is None:
-                logger.info('action=skip, reason=!detail')
+    # Task list of the NAS, reused from the placement or polled once
+    if snapshot is None and placement is not None:
+        snapshot = placement.snapshot
+    elif snapshot is None:
+        found = nodes.configured(synology, watch=args.output)
+        if found[0]['ip'] is not None:
+            try:
+                snapshot = nodes.poll(found)
+            except Exception as e:
+                logger.warning('action=list, reason=%s', e)
+
+    # Known torrents by infohash and by name and size
+    known = index.Index()
+    outputs = [node['watch'] for node in placement.nodes] \
+        if placement is not None else [args.output]
+    for output in outputs:
+        known.scan(output)
+    if snapshot is not None:
+        known.update(snapshot)
+
+    # Number of new downloads the NAS can still take
+    slots = None
+    if snapshot is not None and limit is not None:
+        slots = limit - snapshot.count('downloading', 'waiting')
+        logger.info('action=admit, slots=%d', slots)
+
+    # Stage 1: collect the candidates worth downloading
+    candidates = []
+    for item in items:
+        tid = item['id']
+        logger.info('tid=%s', tid)
+
+        if slots is not None and slots <= 0:
+            logger.info('action=stop, reason=queue_full')
+            # keep the cursor so the remaining items are seen next time
+            cursors = None
+            break
+
+        # Skip if already queued on the NAS
+        queued = snapshot is not None and str(tid) in snapshot.tids
+        if not args.force and queued:
+            logger.info('action=skip, reason=queued')
+            continue
+
+        # Skip torrents withdrawn before as duplicates of a known infohash
+        alias = known.alias(tid)
+        if not args.force and alias is not None:
+            logger.info('action=skip, reason=duplicate, of=%s', alias)
+            continue
+
+        # Skip if already downloaded (unless --force is set)
+        if placement is not None:
+            exist = placement.exist(key=args.key, tid=tid)
+        else:
+            exist = mt.exist(tid=tid)
+        if not args.force and exist:
+            logger.info('action=skip, reason=exist')
+            continue
+
+        # Fetch detailed metadata
+        detail = mt.detail(tid=tid)
+        if detail is None:
+            logger.info('action=skip, reason=!detail')
+            continue
+
+        if args.verbose:
+            logger.info(
+                'name=%s, status=%s',
+                detail['name'],
+                detail['status']['discount']
+            )
+
+        # Check for free discount if --free is specified
+        if args.free and 'FREE' != detail['status']['discount']:
+            logger.info('action=skip, reason=!free')
+            continue
+
+        # Skip re-uploads and torrents already on the NAS under another tid
+        duplicate = known.duplicate(tid, detail)
+        if not args.force and duplicate is not None:
+            logger.info('action=skip, reason=duplicate, of=%s', duplicate)
+            continue
+
+        candidates.append((tid, detail))
+
+    # Stage 2: download the ones closest to losing their free window first
+    for tid, detail in schedule.order(
+        candidates,
+        now=time.time(),
+        config=(common.load('mt.json') or {}).get('schedule')
+    ):
+        if slots is not None and slots <= 0:
+            logger.info('tid=%s, action=stop, reason=queue_full', tid)
+            cursors = None
+            break
+
+        target, output = mt, args.output
+        if placement is not None:
+            node = placement.place(size=int(detail.get('size') or 0))
+            if node is None:
+                logger.info('tid=%s, action=skip, reason=!space', tid)
                 continue
+            logger.info('tid=%s, node=%s', tid, node['name'])
+            output = node['watch']
+            target = common.mt(key=args.key, output=output)
+
+        if args.dry_run:
+            logger.info('[Dry Run] Would download: %s', tid)
+        else:
+            target.download(tid=tid, detail=detail)
 
-            if args.verbose:
+            # Withdraw the torrent before the NAS loads it if the infohash
+            # is already known under another tid
+            file = os.path.join(output, f'{tid}.torrent')
+            duplicate = known.claim(file) if os.path.exists(file) else None
+            if not args.force and duplicate is not None:
                 logger.info(
-                    'name=%s, status=%s',
-                    detail['name'],
-                    detail['status']['discount']
+                    'tid=%s, action=withdraw, reason=duplicate, of=%s',
+                    tid,
+                    duplicate
                 )
-
-            # Check for free discount if --free is specified
-            if args.free and 'FREE' != detail['status']['discount']:
-                logger.info('action=skip, reason=!free')
+                for name in (file, os.path.join(output, f'{tid}.info')):
+                    if os.path.exists(name):
+                        os.remove(name)
                 continue
 
-            mt.download(tid=tid, detail=detail)
+        if slots is not None:
+            slots -= 1
+
+    known.save()
+
+    if cursors is not None and not args.dry_run:
+        feed.save(cursors)
+
+def main():
+    '''Entry point: parse arguments'''
+    parser = argparse.ArgumentParser(
+        description=__description__,
+        epilog=__epilog__
+    )
+    arguments(parser)
+    args = parser.parse_args(sys.argv[1:])
+
+    # Apply log level to all handlers
+    common.setup_logging(
+        file='app.log',
+        level=logging.DEBUG if args.verbose else logging.INFO
+    )
+
+    try:
+        run(args)
+    finally:
+        common.close()
 
 if __name__ == '__main__':
     main()
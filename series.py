@@ -0,0 +1,228 @@
+'''
+Append-only time-series store of Download Station transfer statistics
+
+Every poll appends one fixed-size binary record per task, keyed by a
+digest of its tid. Once per resolution bucket the file is compacted:
+samples older than the raw period are downsampled to one per bucket,
+samples past the retention period are dropped, and the records are
+rewritten in time order after a header holding the compaction time.
+Other polls only read the records of the last window, located by a
+binary search on the record times.
+'''
+import os
+import struct
+import hashlib
+import logging
+
+from collections import namedtuple
+
+import common
+
+logger = logging.getLogger(__name__)
+
+FILE = os.path.join(common.BASE, 'series.bin')
+
+# time, tid digest, downloaded pieces, downloaded, uploaded, speeds
+RECORD = struct.Struct('<d16sIQQII')
+
+# Key of the header record of a compacted file
+HEADER = bytes(16)
+
+Sample = namedtuple('Sample', (
+    'time',
+    'downloaded_pieces',
+    'downloaded',
+    'uploaded',
+    'download_speed',
+    'upload_speed'
+))
+
+def digest(tid: str) -> bytes:
+    '''Fixed-width key of a tid, which may be a whole magnet URI'''
+    return hashlib.blake2b(tid.encode(), digest_size=16).digest()
+
+def pack(time: float, table) -> bytes:
+    '''Encode the current row of every task of the table'''
+    columns = [
+        table['downloaded_pieces'],
+        table['downloaded'],
+        table['uploaded'],
+        table['download_speed'],
+        table['upload_speed']
+    ]
+    return b''.join(
+        RECORD.pack(
+            time,
+            digest(tid),
+            *(int(column[index]) for column in columns)
+        )
+        for index, tid in enumerate(table.tid)
+    )
+
+def compacted(file: str = FILE) -> float:
+    '''Return the time of the last compaction, 0 if never compacted'''
+    try:
+        with open(file, 'rb') as fp:
+            data = fp.read(RECORD.size)
+    except OSError:
+        return 0.0
+
+    if len(data) < RECORD.size:
+        return 0.0
+
+    time, key, *_ = RECORD.unpack(data)
+    return time if key == HEADER else 0.0
+
+def locate(fp, count: int, since: float) -> int:
+    '''Index of the first record at or after since in a compacted file'''
+    low, high = 1, count
+    while low < high:
+        middle = (low + high) // 2
+        fp.seek(middle * RECORD.size)
+        if RECORD.unpack(fp.read(RECORD.size))[0] < since:
+            low = middle + 1
+        else:
+            high = middle
+
+    return low
+
+def read(file: str = FILE, since: float = None) -> dict:
+    '''Load the samples grouped by key, oldest first, from since on'''
+    history = {}
+    if not os.path.exists(file):
+        return history
+
+    with open(file, 'rb') as fp:
+        # ignore a record truncated by an interrupted append
+        count = os.fstat(fp.fileno()).st_size // RECORD.size
+        start = locate(fp, count, since) if since is not None else 0
+        fp.seek(start * RECORD.size)
+        data = fp.read((count - start) * RECORD.size)
+
+    for time, key, *values in RECORD.iter_unpack(data):
+        if key != HEADER:
+            history.setdefault(key, []).append(Sample(time, *values))
+
+    return history
+
+def write(history: dict, now: float, file: str = FILE) -> None:
+    '''Rewrite the store atomically, in time order after the header'''
+    records = sorted(
+        (
+            (sample, key)
+            for key, samples in history.items()
+            for sample in samples
+        ),
+        key=lambda record: record[0].time
+    )
+
+    temp = f'{file}.tmp'
+    with open(temp, 'wb') as fp:
+        fp.write(RECORD.pack(now, HEADER, 0, 0, 0, 0, 0))
+        fp.write(b''.join(
+            RECORD.pack(sample[0], key, *sample[1:])
+            for sample, key in records
+        ))
+    os.replace(temp, file)
+
+def downsample(
+    samples: list,
+    now: float,
+    raw: float,
+    resolution: float,
+    retention: float
+) -> list:
+    '''Keep recent samples and the last sample of each older bucket'''
+    kept = []
+    for sample in samples:
+        age = now - sample.time
+        if age > retention:
+            continue
+
+        if age > raw and kept and now - kept[-1].time > raw and \
+                kept[-1].time // resolution == sample.time // resolution:
+            kept[-1] = sample
+        else:
+            kept.append(sample)
+
+    return kept
+
+def update(
+    table,
+    now: float,
+    config: dict = None,
+    window: float = None,
+    file: str = FILE
+) -> dict:
+    '''Append the current samples and return the recent live history'''
+    config = config or {}
+    file = config.get('file', file)
+    resolution = config.get('resolution', 3600)
+    if window is None:
+        window = config.get('window', 86400)
+
+    with open(file, 'ab') as fp:
+        # drop a record truncated by an interrupted append
+        end = fp.tell()
+        if end % RECORD.size:
+            fp.truncate(end - end % RECORD.size)
+        fp.write(pack(now, table))
+
+    keys = {digest(tid): tid for tid in table.tid}
+
+    if now - compacted(file) < resolution:
+        history = read(file, since=now - window)
+        return {
+            keys[key]: samples
+            for key, samples in history.items() if key in keys
+        }
+
+    # downsample the live tasks and drop the others
+    history = read(file)
+    total = sum(len(samples) for samples in history.values())
+    history = {
+        key: downsample(
+            samples,
+            now=now,
+            raw=config.get('raw', 86400),
+            resolution=resolution,
+            retention=config.get('retention', 30 * 86400)
+        )
+        for key, samples in history.items() if key in keys
+    }
+    write(history, now, file)
+    logger.debug(
+        'action=compact, total=%d, kept=%d',
+        total,
+        sum(len(samples) for samples in history.values())
+    )
+
+    return {
+        keys[key]: [s for s in samples if s.time >= now - window]
+        for key, samples in history.items()
+    }
+
+def stalled(samples: list, now: float, count: int) -> float:
+    '''Seconds since the download progress last changed'''
+    if len(samples) < count:
+        return 0.0
+
+    # oldest sample of the trailing run without progress
+    first = samples[-1]
+    for sample in reversed(samples):
+        if sample.downloaded != first.downloaded:
+            break
+        first = sample
+
+    return now - first.time
+
+def rate(samples: list, field: str = 'uploaded', since: float = None) -> float:
+    '''Average bytes per second of a counter over the samples'''
+    if since is not None:
+        samples = [s for s in samples if s.time >= since]
+    if len(samples) < 2 or samples[-1].time <= samples[0].time:
+        return 0.0
+
+    first, last = samples[0], samples[-1]
+    return (getattr(last, field) - getattr(first, field)) / \
+        (last.time - first.time)
@@ -0,0 +1,92 @@
+'''
+Snapshot of the Synology Download Station task list shared by the tools
+'''
+import logging
+
+logger = logging.getLogger(__name__)
+
+def tid(item: dict) -> str:
+    '''Extract the M-Team torrent ID from the torrent URI of a task'''
+    uri = item.get('additional', {}).get('detail', {}).get('uri', '')
+    return uri.replace('.torrent', '')
+
+class Task:
+    '''Flat record of the task fields used by the tools'''
+
+    __slots__ = (
+        'id',
+        'tid',
+        'title',
+        'status',
+        'node',
+        'size',
+        'create_time',
+        'started_time',
+        'completed_time',
+        'downloaded_pieces',
+        'downloaded',
+        'uploaded',
+        'download_speed',
+        'upload_speed'
+    )
+
+    def __init__(self, item: dict, node: str = None):
+        additional = item.get('additional', {})
+        detail = additional.get('detail', {})
+        transfer = additional.get('transfer', {})
+
+        self.id = item['id']
+        self.tid = tid(item)
+        self.title = item['title']
+        self.status = item['status']
+        self.node = node
+        self.size = int(item.get('size', 0))
+        self.create_time = detail.get('create_time', 0)
+        self.started_time = detail.get('started_time', 0)
+        self.completed_time = detail.get('completed_time', 0)
+        self.downloaded_pieces = transfer.get('downloaded_pieces', 0)
+        self.downloaded = int(transfer.get('size_downloaded', 0))
+        self.uploaded = int(transfer.get('size_uploaded', 0))
+        self.download_speed = transfer.get('speed_download', 0)
+        self.upload_speed = transfer.get('speed_upload', 0)
+
+def decode(items: list, node: str = None) -> list:
+    '''Convert the task dicts, releasing each one once it is converted'''
+    items.reverse()
+
+    converted = []
+    while items:
+        converted.append(Task(items.pop(), node=node))
+
+    return converted
+
+class Snapshot:
+    '''Task list fetched once and shared by check, clean and search'''
+
+    def __init__(self, tasks: list):
+        self.tasks = tasks
+        self.tids = {task.tid for task in tasks} - {''}
+        # nodes whose task list could not be fetched
+        self.failed = set()
+
+    def __iter__(self):
+        return iter(self.tasks)
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def count(self, *status: str) -> int:
+        '''Count the tasks in any of the given states'''
+        return sum(1 for task in self.tasks if task.status in status)
+
+    def discard(self, tids: set) -> None:
+        '''Drop the tasks that were deleted since the snapshot was taken'''
+        self.tasks = [task for task in self.tasks if task.tid not in tids]
+        self.tids -= set(tids)
+
+def fetch(syno, node: str = None) -> Snapshot:
+    '''Fetch the task list from the NAS'''
+    snapshot = Snapshot(decode(syno.ds.task.list(), node=node))
+    logger.debug('action=list, count=%d', len(snapshot))
+
+    return snapshot
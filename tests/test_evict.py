@@ -0,0 +1,44 @@
+import evict
+import nodes
+
+def test_node_block_without_top_level_eviction():
+    # the multiple NAS layout of the README
+    config = {
+        'nodes': [
+            {
+                'name': 'nas1',
+                'ip': '192.168.1.10',
+                'watch': '/mnt/nas1/Torrent/watch'
+            },
+            {
+                'name': 'nas2',
+                'ip': '192.168.1.11',
+                'watch': '/mnt/nas2/Torrent/watch',
+                'eviction': {'path': '/mnt/nas2/Download'}
+            }
+        ]
+    }
+
+    found = evict.blocks(config, nodes.targets(config))
+
+    assert found == {'nas2': {'path': '/mnt/nas2/Download'}}
+
+def test_node_block_overrides_top_level_eviction():
+    config = {
+        'eviction': {'path': '/volume1/Download', 'threshold': 0.8},
+        'nodes': [
+            {'name': 'nas1', 'ip': '192.168.1.10'},
+            {
+                'name': 'nas2',
+                'ip': '192.168.1.11',
+                'eviction': {'path': '/mnt/nas2/Download'}
+            }
+        ]
+    }
+
+    found = evict.blocks(config, nodes.targets(config))
+
+    assert found == {
+        'nas1': {'path': '/volume1/Download', 'threshold': 0.8},
+        'nas2': {'path': '/mnt/nas2/Download', 'threshold': 0.8}
+    }
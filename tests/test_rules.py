@@ -0,0 +1,51 @@
+import rules
+import series
+import tasks
+
+NOW = 1_000_000.0
+
+def snapshot(status: str, started: float) -> tasks.Snapshot:
+    return tasks.Snapshot(tasks.decode([{
+        'id': 'dbid_1',
+        'title': 'title',
+        'status': status,
+        'size': 1000,
+        'additional': {
+            'detail': {
+                'uri': '1.torrent',
+                'create_time': NOW - 5 * 3600,
+                'started_time': started
+            },
+            'transfer': {'downloaded_pieces': 1, 'size_downloaded': 0}
+        }
+    }], node='nas'))
+
+def samples(start: float, step: float = 600) -> list:
+    return [
+        series.Sample(time, 0, 0, 0, 0, 0)
+        for time in range(int(start), int(NOW) + 1, int(step))
+    ]
+
+def picked(status: str, started: float, history: list) -> dict:
+    compiled = rules.build()
+    table = rules.Table(snapshot(status, started), paths={}, now=NOW)
+    table.attach({'1': history}, now=NOW, count=6, window=86400)
+    return table, rules.evaluate(compiled, table)
+
+def test_stalled_ignores_time_spent_waiting():
+    # queued for over 4 hours, started downloading a minute ago
+    table, found = picked('downloading', NOW - 60, samples(NOW - 4 * 3600))
+
+    assert table['stalled'][0] == 60
+    assert found == {}
+
+def test_stalled_deletes_download_without_progress():
+    table, found = picked(
+        'downloading',
+        NOW - 5 * 3600,
+        samples(NOW - 4 * 3600)
+    )
+
+    assert table['stalled'][0] == 4 * 3600
+    assert found[0][0] == 'delete'
+    assert found[0][1][0].startswith('stalled(')